@@ -31,8 +31,9 @@
 
 # Import libraries
 from pyspark.sql import functions as F
-from pyspark.sql.types import StructType, StructField, StringType, IntegerType, DoubleType, TimestampType
 from pyspark.sql.window import Window
+from pyspark import StorageLevel
+from pyspark.errors import AnalysisException, PySparkException
 import datetime
 
 # Set database name
@@ -45,6 +46,48 @@ bronze_path = "/Volumes/healthcare_readmission/default/readmission_prediction_pr
 silver_path = "/Volumes/healthcare_readmission/default/readmission_prediction_project/silver/"
 gold_path   = "/Volumes/healthcare_readmission/default/readmission_prediction_project/gold/"
 
+# Spark configuration
+def set_optional_conf(key, value):
+    """Set a tuning conf where the compute allows it; serverless rejects most keys with CONFIG_NOT_AVAILABLE."""
+    try:
+        spark.conf.set(key, value)
+    except AnalysisException:
+        print(f"  (skipped {key}: not configurable on this compute)")
+
+def persist_for_reuse(df):
+    """Persist df for reuse across jobs; serverless compute has no DataFrame cache, so df is returned as-is there."""
+    try:
+        return df.persist(StorageLevel.MEMORY_AND_DISK)
+    except PySparkException:
+        return df
+
+def release_cache(*dfs):
+    """Unpersist only the given DataFrames, leaving anything else cached in the session alone."""
+    for df in dfs:
+        try:
+            df.unpersist()
+        except PySparkException:
+            pass
+
+# A few thousand rows per table: 16 shuffle partitions instead of the default 200
+# (settable on serverless and classic compute alike)
+spark.conf.set("spark.sql.shuffle.partitions", "16")
+# Let AQE coalesce the tiny partitions that remain (already on by default on serverless)
+set_optional_conf("spark.sql.adaptive.enabled", True)
+set_optional_conf("spark.sql.adaptive.coalescePartitions.enabled", True)
+set_optional_conf("spark.sql.adaptive.skewJoin.enabled", True)
+# Smaller in-memory column batches for the cached Silver tables
+set_optional_conf("spark.sql.inMemoryColumnarStorage.batchSize", 8192)
+# Per-patient feature tables are small, let them be broadcast instead of shuffled
+set_optional_conf("spark.sql.autoBroadcastJoinThreshold", 256 * 1024 * 1024)
+# Target 128MB files when OPTIMIZE compacts the Silver tables
+set_optional_conf("spark.databricks.delta.optimize.maxFileSize", 134217728)
+# Coalesce the many tiny part files these small tables would otherwise produce
+set_optional_conf("spark.databricks.delta.optimizeWrite.enabled", True)
+set_optional_conf("spark.databricks.delta.autoCompact.enabled", True)
+# Record the same behaviour as table properties on every Delta table created here
+set_optional_conf("spark.databricks.delta.properties.defaults.autoOptimize.optimizeWrite", True)
+set_optional_conf("spark.databricks.delta.properties.defaults.autoOptimize.autoCompact", True)
 
 # Create directories
 #import os
@@ -67,30 +110,15 @@ print(f"✓ Paths set: Bronze, Silver, Gold (Unity Catalog Volumes)")
 
 # COMMAND ----------
 
-# For Databricks Community Edition: Upload CSV files to workspace first
-# Then load them
-
-# Define schema for patients
-patients_schema = StructType([
-    StructField("patient_id", IntegerType(), True),
-    StructField("first_name", StringType(), True),
-    StructField("last_name", StringType(), True),
-    StructField("date_of_birth", StringType(), True),
-    StructField("age", IntegerType(), True),
-    StructField("gender", StringType(), True),
-    StructField("admission_date", StringType(), True),
-    StructField("discharge_date", StringType(), True),
-    StructField("length_of_stay", IntegerType(), True),
-    StructField("readmitted_30_days", IntegerType(), True)
-])
-
-# LOAD DATA - Option 1: From uploaded CSV file
-# Replace with actual path where you uploaded patients.csv
-df_patients_raw = spark.read.schema(patients_schema).csv(
-    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/patients.csv",  # UPDATE THIS PATH
-    header=True
+# For Databricks Community Edition: Upload the Parquet files from generate_data.py to workspace first
+# Then load them (Parquet carries its own schema, no CSV parsing needed)
+
+# LOAD DATA - Option 1: From uploaded Parquet file
+# Replace with actual path where you uploaded patients.parquet
+df_patients_raw = spark.read.parquet(
+    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/patients.parquet"  # UPDATE THIS PATH
 ).withColumn("ingest_date", F.current_timestamp()) \
- .withColumn("source_file", F.lit("patients.csv")) \
+ .withColumn("source_file", F.lit("patients.parquet")) \
  .withColumn("data_quality_check", F.lit("raw_load"))
 
 # Save to Bronze
@@ -106,19 +134,10 @@ print(f"✓ Bronze Patients: {df_patients_raw.count()} records loaded")
 
 # COMMAND ----------
 
-diagnoses_schema = StructType([
-    StructField("diagnosis_id", IntegerType(), True),
-    StructField("patient_id", IntegerType(), True),
-    StructField("diagnosis_code", StringType(), True),
-    StructField("diagnosis_description", StringType(), True),
-    StructField("primary_diagnosis", IntegerType(), True)
-])
-
-df_diagnoses_raw = spark.read.schema(diagnoses_schema).csv(
-    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/diagnoses.csv",  # UPDATE THIS PATH
-    header=True
+df_diagnoses_raw = spark.read.parquet(
+    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/diagnoses.parquet"  # UPDATE THIS PATH
 ).withColumn("ingest_date", F.current_timestamp()) \
- .withColumn("source_file", F.lit("diagnoses.csv"))
+ .withColumn("source_file", F.lit("diagnoses.parquet"))
 
 df_diagnoses_raw.write.format("delta").mode("overwrite").save(
     f"{bronze_path}diagnoses"
@@ -132,20 +151,10 @@ print(f"✓ Bronze Diagnoses: {df_diagnoses_raw.count()} records loaded")
 
 # COMMAND ----------
 
-lab_schema = StructType([
-    StructField("lab_id", IntegerType(), True),
-    StructField("patient_id", IntegerType(), True),
-    StructField("test_name", StringType(), True),
-    StructField("test_value", DoubleType(), True),
-    StructField("test_date", StringType(), True),
-    StructField("reference_range", StringType(), True)
-])
-
-df_labs_raw = spark.read.schema(lab_schema).csv(
-    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/lab_results.csv",  # UPDATE THIS PATH
-    header=True
+df_labs_raw = spark.read.parquet(
+    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/lab_results.parquet"  # UPDATE THIS PATH
 ).withColumn("ingest_date", F.current_timestamp()) \
- .withColumn("source_file", F.lit("lab_results.csv"))
+ .withColumn("source_file", F.lit("lab_results.parquet"))
 
 df_labs_raw.write.format("delta").mode("overwrite").save(
     f"{bronze_path}lab_results"
@@ -159,21 +168,10 @@ print(f"✓ Bronze Lab Results: {df_labs_raw.count()} records loaded")
 
 # COMMAND ----------
 
-meds_schema = StructType([
-    StructField("medication_id", IntegerType(), True),
-    StructField("patient_id", IntegerType(), True),
-    StructField("medication_name", StringType(), True),
-    StructField("dosage", StringType(), True),
-    StructField("frequency", StringType(), True),
-    StructField("start_date", StringType(), True),
-    StructField("end_date", StringType(), True)
-])
-
-df_meds_raw = spark.read.schema(meds_schema).csv(
-    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/medications.csv",  # UPDATE THIS PATH
-    header=True
+df_meds_raw = spark.read.parquet(
+    "/Volumes/workspace/healthcare1_workspace/healthcare1_volume/medications.parquet"  # UPDATE THIS PATH
 ).withColumn("ingest_date", F.current_timestamp()) \
- .withColumn("source_file", F.lit("medications.csv"))
+ .withColumn("source_file", F.lit("medications.parquet"))
 
 df_meds_raw.write.format("delta").mode("overwrite").save(
     f"{bronze_path}medications"
@@ -192,63 +190,62 @@ print(f"✓ Bronze Medications: {df_meds_raw.count()} records loaded")
 
 # COMMAND ----------
 
-# Read Bronze
-df_patients_bronze = spark.read.format("delta").load(f"{bronze_path}patients")
+# Bronze input: reuse the ingested DataFrame instead of re-reading the Bronze
+# table that was just written (the Parquet source is the record of truth)
+df_patients_bronze = df_patients_raw
+
+# Parsed columns are reused by the quality checks and the fingerprint below
+# Parse DOB in multiple formats: try_to_timestamp returns null on a mismatch even
+# with ANSI mode on, so the first format that parses wins (most common format first)
+dob_parsed = F.coalesce(
+    F.to_date(F.try_to_timestamp(F.col("date_of_birth"), F.lit("MM/dd/yyyy"))),
+    F.to_date(F.try_to_timestamp(F.col("date_of_birth"), F.lit("yyyy-MM-dd")))
+)
+admission_date_parsed = F.to_date(F.col("admission_date"), "yyyy-MM-dd")
 
-# STEP 1: Standardize data types and formats
-df_patients_clean = df_patients_bronze.select(
+# Standardize formats, run quality checks and build the dedup fingerprint in one projection
+df_for_dedup = df_patients_bronze.select(
+    # STEP 1: Standardize data types and formats
     F.col("patient_id"),
     F.col("first_name"),
     F.col("last_name"),
-    # Parse DOB in multiple formats
-    F.when(
-        F.col("date_of_birth").rlike(r"^\d{2}/\d{2}/\d{4}$"),
-        F.to_date(F.col("date_of_birth"), "MM/dd/yyyy")
-    ).otherwise(
-        F.to_date(F.col("date_of_birth"), "yyyy-MM-dd")
-    ).alias("date_of_birth"),
+    dob_parsed.alias("date_of_birth"),
     F.col("age"),
     F.col("gender"),
-    F.to_date(F.col("admission_date"), "yyyy-MM-dd").alias("admission_date"),
+    admission_date_parsed.alias("admission_date"),
     F.to_date(F.col("discharge_date"), "yyyy-MM-dd").alias("discharge_date"),
     F.col("length_of_stay"),
     F.col("readmitted_30_days"),
     F.current_timestamp().alias("processed_date"),
-    F.lit(None).alias("data_quality_issue")  # Will populate below
-)
-
-# STEP 2: Data Quality Checks
-df_patients_quality = df_patients_clean.withColumn(
-    "data_quality_issue",
+    # STEP 2: Data Quality Checks
     F.when(F.col("first_name").isNull(), F.lit("null_first_name"))
      .when(F.col("last_name").isNull(), F.lit("null_last_name"))
      .when(F.col("age") < 0, F.lit("invalid_age"))
      .when(F.col("age") > 120, F.lit("invalid_age"))
-     .when(F.col("admission_date").isNull(), F.lit("null_admission_date"))
+     .when(admission_date_parsed.isNull(), F.lit("null_admission_date"))
      .when(F.col("length_of_stay") <= 0, F.lit("invalid_los"))
      .otherwise(F.lit(None))
-)
-
-# STEP 3: Deduplication using fuzzy matching
-# Create a fingerprint for matching: FIRST_NAME + LAST_NAME + DOB
-df_for_dedup = df_patients_quality.withColumn(
-    "patient_fingerprint",
+     .alias("data_quality_issue"),
+    # STEP 3: Deduplication using fuzzy matching
+    # Create a fingerprint for matching: FIRST_NAME + LAST_NAME + DOB
     F.concat_ws("|",
         F.upper(F.col("first_name")),
         F.upper(F.col("last_name")),
-        F.col("date_of_birth")
-    )
+        dob_parsed
+    ).alias("patient_fingerprint")
 )
 
 # Assign unique patient_key to deduplicated records
+# Hashing the fingerprint gives every duplicate the same key without an
+# unpartitioned window (which would pull all rows into a single partition)
 # Keep the first occurrence, flag duplicates
 window_spec = Window.partitionBy("patient_fingerprint").orderBy(F.col("patient_id"))
 df_deduped = df_for_dedup.withColumn(
     "row_num", F.row_number().over(window_spec)
 ).withColumn(
-    "patient_key", F.dense_rank().over(Window.orderBy("patient_fingerprint"))
+    "patient_key", F.xxhash64(F.col("patient_fingerprint"))
 ).withColumn(
-    "is_duplicate", F.when(F.col("row_num") > 1, F.lit(1)).otherwise(F.lit(0))
+    "is_duplicate", (F.col("row_num") > 1).cast("int")
 )
 
 # Select final silver schema
@@ -269,15 +266,29 @@ df_patients_silver = df_deduped.select(
     F.col("processed_date")
 )
 
-# Save to Silver
-df_patients_silver.write.format("delta").mode("overwrite").save(
+# Reused by the write and the metrics below, so compute the dedup windows once
+df_patients_silver = persist_for_reuse(df_patients_silver)
+
+# Save to Silver (overwriteSchema: patient_key is now a LongType hash, not an int rank)
+df_patients_silver.write.format("delta").mode("overwrite").option("overwriteSchema", "true").save(
     f"{silver_path}patients"
 )
 
-print(f"✓ Silver Patients: {df_patients_silver.count()} records processed")
-print(f"  - Unique patients (patient_key): {df_patients_silver.select('patient_key').distinct().count()}")
-print(f"  - Duplicates detected: {df_patients_silver.filter(F.col('is_duplicate') == 1).count()}")
-print(f"  - Records with quality issues: {df_patients_silver.filter(F.col('data_quality_issue').isNotNull()).count()}")
+# Co-locate rows by the Gold join key so file skipping applies to the joins
+spark.sql(f"OPTIMIZE delta.`{silver_path}patients` ZORDER BY (original_patient_id)")
+
+# Collect all counts in a single Spark job
+patients_stats = df_patients_silver.agg(
+    F.count("*").alias("total"),
+    F.sum("is_duplicate").alias("dups"),
+    F.sum(F.col("data_quality_issue").isNotNull().cast("int")).alias("quality_issues")
+).first()
+
+print(f"✓ Silver Patients: {patients_stats['total']} records processed")
+# Every duplicate shares its original's patient_key, so unique = total - duplicates
+print(f"  - Unique patients (patient_key): {patients_stats['total'] - patients_stats['dups']}")
+print(f"  - Duplicates detected: {patients_stats['dups']}")
+print(f"  - Records with quality issues: {patients_stats['quality_issues']}")
 
 # COMMAND ----------
 
@@ -286,7 +297,7 @@ print(f"  - Records with quality issues: {df_patients_silver.filter(F.col('data_
 
 # COMMAND ----------
 
-df_diagnoses_bronze = spark.read.format("delta").load(f"{bronze_path}diagnoses")
+df_diagnoses_bronze = df_diagnoses_raw
 
 # Standardize diagnosis codes to uppercase and remove special characters
 df_diagnoses_clean = df_diagnoses_bronze.select(
@@ -321,12 +332,20 @@ df_diagnoses_silver = df_diagnoses_clean.select(
     F.col("processed_date")
 )
 
+df_diagnoses_silver = persist_for_reuse(df_diagnoses_silver)
+
 df_diagnoses_silver.write.format("delta").mode("overwrite").save(
     f"{silver_path}diagnoses"
 )
+spark.sql(f"OPTIMIZE delta.`{silver_path}diagnoses` ZORDER BY (patient_id)")
+
+diagnoses_stats = df_diagnoses_silver.agg(
+    F.count("*").alias("total"),
+    F.sum(F.col("data_quality_issue").isNotNull().cast("int")).alias("quality_issues")
+).first()
 
-print(f"✓ Silver Diagnoses: {df_diagnoses_silver.count()} records processed")
-print(f"  - Records with quality issues: {df_diagnoses_silver.filter(F.col('data_quality_issue').isNotNull()).count()}")
+print(f"✓ Silver Diagnoses: {diagnoses_stats['total']} records processed")
+print(f"  - Records with quality issues: {diagnoses_stats['quality_issues']}")
 
 # COMMAND ----------
 
@@ -335,16 +354,21 @@ print(f"  - Records with quality issues: {df_diagnoses_silver.filter(F.col('data
 
 # COMMAND ----------
 
-df_labs_bronze = spark.read.format("delta").load(f"{bronze_path}lab_results")
+df_labs_bronze = df_labs_raw
 
 # Detect outliers using IQR (Interquartile Range) method
-# Calculate quartiles grouped by test_name
-window_by_test = Window.partitionBy("test_name")
+# Calculate quartiles once per test_name (only a handful of tests)
+df_test_quartiles = df_labs_bronze.groupBy("test_name").agg(
+    F.percentile_approx(F.col("test_value"), [0.25, 0.75]).alias("quartiles")
+).select(
+    F.col("test_name"),
+    F.col("quartiles")[0].alias("q1"),
+    F.col("quartiles")[1].alias("q3")
+)
 
-df_labs_stats = df_labs_bronze.withColumn(
-    "q1", F.percentile_approx(F.col("test_value"), 0.25).over(window_by_test)
-).withColumn(
-    "q3", F.percentile_approx(F.col("test_value"), 0.75).over(window_by_test)
+# Broadcast the tiny quartile table back onto every lab row
+df_labs_stats = df_labs_bronze.join(
+    F.broadcast(df_test_quartiles), "test_name", "left"
 ).withColumn(
     "iqr", F.col("q3") - F.col("q1")
 ).withColumn(
@@ -380,13 +404,22 @@ df_labs_silver = df_labs_stats.select(
     F.current_timestamp().alias("processed_date")
 )
 
+df_labs_silver = persist_for_reuse(df_labs_silver)
+
 df_labs_silver.write.format("delta").mode("overwrite").save(
     f"{silver_path}lab_results"
 )
+spark.sql(f"OPTIMIZE delta.`{silver_path}lab_results` ZORDER BY (patient_id)")
 
-print(f"✓ Silver Lab Results: {df_labs_silver.count()} records processed")
-print(f"  - Outliers detected: {df_labs_silver.filter(F.col('is_outlier') == 1).count()}")
-print(f"  - Records with quality issues: {df_labs_silver.filter(F.col('data_quality_issue').isNotNull()).count()}")
+labs_stats = df_labs_silver.agg(
+    F.count("*").alias("total"),
+    F.sum("is_outlier").alias("outliers"),
+    F.sum(F.col("data_quality_issue").isNotNull().cast("int")).alias("quality_issues")
+).first()
+
+print(f"✓ Silver Lab Results: {labs_stats['total']} records processed")
+print(f"  - Outliers detected: {labs_stats['outliers']}")
+print(f"  - Records with quality issues: {labs_stats['quality_issues']}")
 
 # COMMAND ----------
 
@@ -395,7 +428,7 @@ print(f"  - Records with quality issues: {df_labs_silver.filter(F.col('data_qual
 
 # COMMAND ----------
 
-df_meds_bronze = spark.read.format("delta").load(f"{bronze_path}medications")
+df_meds_bronze = df_meds_raw
 
 # Standardize medication names
 # Map common misspellings to standard names
@@ -408,16 +441,23 @@ medication_mapping = {
     "ASPIRIN": ["ASPIRIN", "ASA"]
 }
 
+# Flatten the mapping into a small (spelling -> standard name) lookup table
+df_medication_lookup = spark.createDataFrame(
+    [(variant, standard.capitalize())
+     for standard, variants in medication_mapping.items()
+     for variant in variants],
+    ["medication_name_upper", "medication_name_lookup"]
+)
+
 # Create standardization logic
+# Broadcast join: one hash probe per row instead of a chain of regex matches
 df_meds_standardized = df_meds_bronze.withColumn(
+    "medication_name_upper", F.upper(F.col("medication_name"))
+).join(
+    F.broadcast(df_medication_lookup), "medication_name_upper", "left"
+).withColumn(
     "medication_name_standard",
-    F.when(F.upper(F.col("medication_name")).rlike("METFORMIN"), F.lit("Metformin"))
-     .when(F.upper(F.col("medication_name")).rlike("LISINOPRIL"), F.lit("Lisinopril"))
-     .when(F.upper(F.col("medication_name")).rlike("ATORVASTATIN"), F.lit("Atorvastatin"))
-     .when(F.upper(F.col("medication_name")).rlike("OMEPRAZOLE"), F.lit("Omeprazole"))
-     .when(F.upper(F.col("medication_name")).rlike("ALBUTEROL"), F.lit("Albuterol"))
-     .when(F.upper(F.col("medication_name")).rlike("ASPIRIN|ASA"), F.lit("Aspirin"))
-     .otherwise(F.col("medication_name"))
+    F.coalesce(F.col("medication_name_lookup"), F.col("medication_name"))
 ).withColumn(
     "start_date_parsed", F.to_date(F.col("start_date"), "yyyy-MM-dd")
 ).withColumn(
@@ -441,12 +481,20 @@ df_meds_silver = df_meds_standardized.select(
     F.current_timestamp().alias("processed_date")
 )
 
+df_meds_silver = persist_for_reuse(df_meds_silver)
+
 df_meds_silver.write.format("delta").mode("overwrite").save(
     f"{silver_path}medications"
 )
+spark.sql(f"OPTIMIZE delta.`{silver_path}medications` ZORDER BY (patient_id)")
+
+meds_stats = df_meds_silver.agg(
+    F.count("*").alias("total"),
+    F.sum(F.col("data_quality_issue").isNotNull().cast("int")).alias("standardized")
+).first()
 
-print(f"✓ Silver Medications: {df_meds_silver.count()} records processed")
-print(f"  - Standardized names: {df_meds_silver.filter(F.col('data_quality_issue').isNotNull()).count()}")
+print(f"✓ Silver Medications: {meds_stats['total']} records processed")
+print(f"  - Standardized names: {meds_stats['standardized']}")
 
 # COMMAND ----------
 
@@ -460,11 +508,15 @@ print(f"  - Standardized names: {df_meds_silver.filter(F.col('data_quality_issue
 
 # COMMAND ----------
 
-# Read Silver tables
-df_patients_silver = spark.read.format("delta").load(f"{silver_path}patients")
-df_diagnoses_silver = spark.read.format("delta").load(f"{silver_path}diagnoses")
-df_labs_silver = spark.read.format("delta").load(f"{silver_path}lab_results")
-df_meds_silver = spark.read.format("delta").load(f"{silver_path}medications")
+# Release the caches held while building Silver
+release_cache(df_patients_silver, df_diagnoses_silver, df_labs_silver, df_meds_silver)
+
+# Read Silver tables once and cache them: Gold features and the quality
+# report in section 4 reuse these instead of re-scanning the Delta files
+df_patients_silver = persist_for_reuse(spark.read.format("delta").load(f"{silver_path}patients"))
+df_diagnoses_silver = persist_for_reuse(spark.read.format("delta").load(f"{silver_path}diagnoses"))
+df_labs_silver = persist_for_reuse(spark.read.format("delta").load(f"{silver_path}lab_results"))
+df_meds_silver = persist_for_reuse(spark.read.format("delta").load(f"{silver_path}medications"))
 
 # Create patient master: use patient_key from deduped patients
 df_patient_master = df_patients_silver.select(
@@ -490,32 +542,21 @@ print(f"✓ Patient Master: {df_patient_master.count()} unique patients")
 # COMMAND ----------
 
 # Create diagnosis features
-df_diagnosis_features = df_diagnoses_silver.filter(
+# max() over a 0/1 indicator gives the binary flag directly
+# Codes are already uppercased with dots/dashes stripped, so prefix matches suffice
+df_diagnosis_features = df_diagnoses_silver.select(
+    "diagnosis_id", "patient_id", "diagnosis_code", "data_quality_issue"  # Only the columns used below
+).filter(
     F.col("data_quality_issue").isNull()  # Exclude bad records
 ).groupBy("patient_id").agg(
     F.count("diagnosis_id").alias("num_diagnoses"),
-    F.sum(F.when(F.col("diagnosis_code").rlike("E11"), 1).otherwise(0)).alias("has_diabetes"),
-    F.sum(F.when(F.col("diagnosis_code").rlike("I10|I5"), 1).otherwise(0)).alias("has_heart_disease"),
-    F.sum(F.when(F.col("diagnosis_code").rlike("J44"), 1).otherwise(0)).alias("has_copd"),
-    F.sum(F.when(F.col("diagnosis_code").rlike("N18"), 1).otherwise(0)).alias("has_ckd"),
-    F.sum(F.when(F.col("diagnosis_code").rlike("F41"), 1).otherwise(0)).alias("has_anxiety"),
-    F.collect_set("diagnosis_code").alias("all_diagnosis_codes")
-)
-
-# Convert indicators to binary (0/1)
-df_diagnosis_features = df_diagnosis_features.select(
-    "*",
-    F.when(F.col("has_diabetes") > 0, 1).otherwise(0).alias("has_diabetes_flag")
-).drop("has_diabetes").withColumnRenamed("has_diabetes_flag", "has_diabetes")
-
-for col_name in ["has_heart_disease", "has_copd", "has_ckd", "has_anxiety"]:
-    df_diagnosis_features = df_diagnosis_features.withColumn(
-        col_name,
-        F.when(F.col(col_name) > 0, 1).otherwise(0)
-    )
-
-# Count chronic conditions
-df_diagnosis_features = df_diagnosis_features.withColumn(
+    F.max(F.when(F.col("diagnosis_code").startswith("E11"), 1).otherwise(0)).alias("has_diabetes"),
+    F.max(F.when(F.col("diagnosis_code").startswith("I10") | F.col("diagnosis_code").startswith("I5"), 1).otherwise(0)).alias("has_heart_disease"),
+    F.max(F.when(F.col("diagnosis_code").startswith("J44"), 1).otherwise(0)).alias("has_copd"),
+    F.max(F.when(F.col("diagnosis_code").startswith("N18"), 1).otherwise(0)).alias("has_ckd"),
+    F.max(F.when(F.col("diagnosis_code").startswith("F41"), 1).otherwise(0)).alias("has_anxiety")
+).withColumn(
+    # Count chronic conditions
     "num_chronic_conditions",
     F.col("has_diabetes") + F.col("has_heart_disease") + F.col("has_copd") + F.col("has_ckd")
 )
@@ -530,24 +571,21 @@ print(f"✓ Diagnosis Features: {df_diagnosis_features.count()} patients")
 # COMMAND ----------
 
 # Create lab result features
-df_lab_features = df_labs_silver.filter(
+df_lab_features = df_labs_silver.select(
+    "lab_id", "patient_id", "test_name", "test_value", "is_outlier", "data_quality_issue"
+).filter(
     (F.col("data_quality_issue").isNull()) &  # Exclude bad records
     (F.col("is_outlier") == 0)  # Exclude outliers
 ).groupBy("patient_id").agg(
-    F.avg(F.when(F.col("test_name") == "Hemoglobin", F.col("test_value"))).alias("avg_hemoglobin"),
-    F.avg(F.when(F.col("test_name") == "Glucose", F.col("test_value"))).alias("avg_glucose"),
-    F.avg(F.when(F.col("test_name") == "WBC", F.col("test_value"))).alias("avg_wbc"),
-    F.avg(F.when(F.col("test_name") == "Creatinine", F.col("test_value"))).alias("avg_creatinine"),
-    F.avg(F.when(F.col("test_name") == "BUN", F.col("test_value"))).alias("avg_bun"),
+    # Averages rounded to 2 decimals
+    F.round(F.avg(F.when(F.col("test_name") == "Hemoglobin", F.col("test_value"))), 2).alias("avg_hemoglobin"),
+    F.round(F.avg(F.when(F.col("test_name") == "Glucose", F.col("test_value"))), 2).alias("avg_glucose"),
+    F.round(F.avg(F.when(F.col("test_name") == "WBC", F.col("test_value"))), 2).alias("avg_wbc"),
+    F.round(F.avg(F.when(F.col("test_name") == "Creatinine", F.col("test_value"))), 2).alias("avg_creatinine"),
+    F.round(F.avg(F.when(F.col("test_name") == "BUN", F.col("test_value"))), 2).alias("avg_bun"),
     F.count("lab_id").alias("num_lab_tests")
 )
 
-# Round to 2 decimals
-for col_name in ["avg_hemoglobin", "avg_glucose", "avg_wbc", "avg_creatinine", "avg_bun"]:
-    df_lab_features = df_lab_features.withColumn(
-        col_name, F.round(F.col(col_name), 2)
-    )
-
 print(f"✓ Lab Features: {df_lab_features.count()} patients")
 
 # COMMAND ----------
@@ -558,21 +596,19 @@ print(f"✓ Lab Features: {df_lab_features.count()} patients")
 # COMMAND ----------
 
 # Create medication features
-df_med_features = df_meds_silver.filter(
+# Names are standardized in Silver, so exact matches replace the regex scans
+# max() over a 0/1 indicator gives the binary flag directly
+df_med_features = df_meds_silver.select(
+    "medication_id", "patient_id", "medication_name", "data_quality_issue"
+).filter(
     F.col("data_quality_issue").isNull()
 ).groupBy("patient_id").agg(
     F.count("medication_id").alias("num_medications"),
-    F.sum(F.when(F.col("medication_name").rlike("Metformin"), 1).otherwise(0)).alias("on_metformin"),
-    F.sum(F.when(F.col("medication_name").rlike("Lisinopril"), 1).otherwise(0)).alias("on_ace_inhibitor"),
-    F.sum(F.when(F.col("medication_name").rlike("Atorvastatin"), 1).otherwise(0)).alias("on_statin"),
+    F.max(F.when(F.col("medication_name") == "Metformin", 1).otherwise(0)).alias("on_metformin"),
+    F.max(F.when(F.col("medication_name") == "Lisinopril", 1).otherwise(0)).alias("on_ace_inhibitor"),
+    F.max(F.when(F.col("medication_name") == "Atorvastatin", 1).otherwise(0)).alias("on_statin")
 )
 
-# Convert to binary
-for col_name in ["on_metformin", "on_ace_inhibitor", "on_statin"]:
-    df_med_features = df_med_features.withColumn(
-        col_name, F.when(F.col(col_name) > 0, 1).otherwise(0)
-    )
-
 print(f"✓ Medication Features: {df_med_features.count()} patients")
 
 # COMMAND ----------
@@ -583,49 +619,44 @@ print(f"✓ Medication Features: {df_med_features.count()} patients")
 # COMMAND ----------
 
 # Join all features together
+# Feature tables hold one row per patient, so broadcast them to avoid a shuffle per join
 # First, join patient master with diagnosis features
 df_gold = df_patient_master.join(
-    df_diagnosis_features,
-    df_patient_master.original_patient_id == df_diagnosis_features.patient_id,
+    F.broadcast(df_diagnosis_features.withColumnRenamed("patient_id", "original_patient_id")),
+    "original_patient_id",
     "left"
-).drop(df_diagnosis_features.patient_id)
+)
 
 # Join with lab features
 df_gold = df_gold.join(
-    df_lab_features,
-    df_gold.original_patient_id == df_lab_features.patient_id,
+    F.broadcast(df_lab_features.withColumnRenamed("patient_id", "original_patient_id")),
+    "original_patient_id",
     "left"
-).drop(df_lab_features.patient_id)
+)
 
 # Join with medication features
 df_gold = df_gold.join(
-    df_med_features,
-    df_gold.original_patient_id == df_med_features.patient_id,
+    F.broadcast(df_med_features.withColumnRenamed("patient_id", "original_patient_id")),
+    "original_patient_id",
     "left"
-).drop(df_med_features.patient_id)
+)
 
 # Fill null values with 0 for count columns
 count_cols = ["num_diagnoses", "num_chronic_conditions", "num_lab_tests", "num_medications"]
-for col_name in count_cols:
-    df_gold = df_gold.withColumn(col_name, F.coalesce(F.col(col_name), F.lit(0)))
 
 # Fill null values with 0 for binary columns
 binary_cols = ["has_diabetes", "has_heart_disease", "has_copd", "has_ckd", "has_anxiety",
                "on_metformin", "on_ace_inhibitor", "on_statin"]
-for col_name in binary_cols:
-    df_gold = df_gold.withColumn(col_name, F.coalesce(F.col(col_name), F.lit(0)))
 
 # Fill null values with 0.0 for numeric columns
 numeric_cols = ["avg_hemoglobin", "avg_glucose", "avg_wbc", "avg_creatinine", "avg_bun"]
-for col_name in numeric_cols:
-    df_gold = df_gold.withColumn(col_name, F.coalesce(F.col(col_name), F.lit(0.0)))
 
-# Add feature generation timestamp
-df_gold = df_gold.withColumn("feature_generation_date", F.current_timestamp())
+# Binary flags and the chronic condition count (0-4) fit in 1 byte
+byte_cols = binary_cols + ["num_chronic_conditions"]
 
 # Select and order final columns
 final_columns = [
-    "patient_key", "original_patient_id", "age", "gender",
+    "patient_key", "original_patient_id", "age", "gender_code",
     "length_of_stay",
     "num_diagnoses", "num_chronic_conditions",
     "has_diabetes", "has_heart_disease", "has_copd", "has_ckd", "has_anxiety",
@@ -636,17 +667,52 @@ final_columns = [
     "feature_generation_date"
 ]
 
-df_gold = df_gold.select(*final_columns)
-
-# Save Gold layer
-df_gold.write.format("delta").mode("overwrite").save(
+# Null filling and the feature generation timestamp go into a single projection
+final_exprs = []
+for col_name in final_columns:
+    if col_name in byte_cols:
+        final_exprs.append(F.coalesce(F.col(col_name), F.lit(0)).cast("byte").alias(col_name))
+    elif col_name in count_cols:
+        final_exprs.append(F.coalesce(F.col(col_name), F.lit(0)).alias(col_name))
+    elif col_name == "gender_code":
+        # Encode gender as 1 = M, 2 = F, 0 = unknown
+        final_exprs.append(
+            F.when(F.col("gender") == "M", 1)
+             .when(F.col("gender") == "F", 2)
+             .otherwise(0)
+             .cast("byte")
+             .alias(col_name)
+        )
+    elif col_name in numeric_cols:
+        final_exprs.append(F.coalesce(F.col(col_name), F.lit(0.0)).alias(col_name))
+    elif col_name == "feature_generation_date":
+        final_exprs.append(F.current_timestamp().alias(col_name))
+    else:
+        final_exprs.append(F.col(col_name))
+
+df_gold = df_gold.select(*final_exprs)
+
+df_gold = persist_for_reuse(df_gold)
+
+# Save Gold layer (overwriteSchema: patient_key, the flags and gender_code changed type)
+df_gold.write.format("delta").mode("overwrite").option("overwriteSchema", "true").save(
     f"{gold_path}patient_readmission_features"
 )
 
-print(f"✓ Gold Layer (Features): {df_gold.count()} patient records")
+# Gold has no duplicate flag to subtract, so unique patients use HyperLogLog (~1% error)
+gold_stats = df_gold.agg(
+    F.count("*").alias("total"),
+    F.approx_count_distinct("patient_key", rsd=0.01).alias("unique"),
+    F.sum("target_readmitted_30_days").alias("readmitted")
+).first()
+
+print(f"✓ Gold Layer (Features): {gold_stats['total']} patient records")
 print(f"\nFeature Engineering Complete!")
-print(f"Total Unique Patients: {df_gold.select('patient_key').distinct().count()}")
-print(f"Readmission Rate: {df_gold.filter(F.col('target_readmitted_30_days') == 1).count() / df_gold.count() * 100:.2f}%")
+print(f"Total Unique Patients: {gold_stats['unique']}")
+print(f"Readmission Rate: {gold_stats['readmitted'] / gold_stats['total'] * 100:.2f}%")
+
+# Gold is re-read from Delta in section 5, so the cached copy is no longer needed
+release_cache(df_gold)
 
 # COMMAND ----------
 
@@ -664,35 +730,58 @@ print("="*70)
 print("DATA QUALITY REPORT")
 print("="*70)
 
-# Read Silver tables for quality metrics
-df_patients_silver = spark.read.format("delta").load(f"{silver_path}patients")
-df_diagnoses_silver = spark.read.format("delta").load(f"{silver_path}diagnoses")
-df_labs_silver = spark.read.format("delta").load(f"{silver_path}lab_results")
-df_meds_silver = spark.read.format("delta").load(f"{silver_path}medications")
+# Quality metrics reuse the Silver tables cached in 3.1
+
+# One aggregation per table instead of a separate count() job per metric
+patients_report = df_patients_silver.agg(
+    F.count("*").alias("total"),
+    F.sum("is_duplicate").alias("dups"),
+    F.sum(F.col("data_quality_issue").isNotNull().cast("int")).alias("quality_issues")
+).first()
+
+diagnoses_report = df_diagnoses_silver.agg(
+    F.count("*").alias("total"),
+    F.sum(F.col("data_quality_issue").isNull().cast("int")).alias("valid"),
+    F.sum((F.col("diagnosis_code_raw") != F.col("diagnosis_code")).cast("int")).alias("standardized")
+).first()
+
+labs_report = df_labs_silver.agg(
+    F.count("*").alias("total"),
+    F.sum("is_outlier").alias("outliers"),
+    F.sum(((F.col("is_outlier") == 0) & F.col("data_quality_issue").isNull()).cast("int")).alias("valid")
+).first()
+
+meds_report = df_meds_silver.agg(
+    F.count("*").alias("total"),
+    F.sum((F.col("medication_name_raw") != F.col("medication_name")).cast("int")).alias("standardized"),
+    F.sum(F.col("data_quality_issue").isNull().cast("int")).alias("valid")
+).first()
+
+# Last use of the Silver tables cached in 3.1
+release_cache(df_patients_silver, df_diagnoses_silver, df_labs_silver, df_meds_silver)
 
 print("\n📊 PATIENTS TABLE")
-print(f"  Total Records: {df_patients_silver.count()}")
-print(f"  Unique Patients: {df_patients_silver.select('patient_key').distinct().count()}")
-print(f"  Duplicates Detected & Flagged: {df_patients_silver.filter(F.col('is_duplicate') == 1).count()}")
-print(f"  Deduplication Rate: {(df_patients_silver.count() - df_patients_silver.select('patient_key').distinct().count()) / df_patients_silver.count() * 100:.2f}%")
-quality_issues = df_patients_silver.filter(F.col("data_quality_issue").isNotNull()).count()
-print(f"  Records with Quality Issues: {quality_issues}")
+print(f"  Total Records: {patients_report['total']}")
+print(f"  Unique Patients: {patients_report['total'] - patients_report['dups']}")
+print(f"  Duplicates Detected & Flagged: {patients_report['dups']}")
+print(f"  Deduplication Rate: {patients_report['dups'] / patients_report['total'] * 100:.2f}%")
+print(f"  Records with Quality Issues: {patients_report['quality_issues']}")
 
 print("\n📋 DIAGNOSES TABLE")
-print(f"  Total Records: {df_diagnoses_silver.count()}")
-print(f"  Valid Records (no quality issues): {df_diagnoses_silver.filter(F.col('data_quality_issue').isNull()).count()}")
-print(f"  Records with Standardized Codes: {df_diagnoses_silver.filter(F.col('diagnosis_code_raw') != F.col('diagnosis_code')).count()}")
+print(f"  Total Records: {diagnoses_report['total']}")
+print(f"  Valid Records (no quality issues): {diagnoses_report['valid']}")
+print(f"  Records with Standardized Codes: {diagnoses_report['standardized']}")
 
 print("\n🧪 LAB RESULTS TABLE")
-print(f"  Total Records: {df_labs_silver.count()}")
-print(f"  Outliers Detected: {df_labs_silver.filter(F.col('is_outlier') == 1).count()}")
-print(f"  Outlier Percentage: {df_labs_silver.filter(F.col('is_outlier') == 1).count() / df_labs_silver.count() * 100:.2f}%")
-print(f"  Valid Records: {df_labs_silver.filter((F.col('is_outlier') == 0) & (F.col('data_quality_issue').isNull())).count()}")
+print(f"  Total Records: {labs_report['total']}")
+print(f"  Outliers Detected: {labs_report['outliers']}")
+print(f"  Outlier Percentage: {labs_report['outliers'] / labs_report['total'] * 100:.2f}%")
+print(f"  Valid Records: {labs_report['valid']}")
 
 print("\n💊 MEDICATIONS TABLE")
-print(f"  Total Records: {df_meds_silver.count()}")
-print(f"  Standardized Medication Names: {df_meds_silver.filter(F.col('medication_name_raw') != F.col('medication_name')).count()}")
-print(f"  Valid Records: {df_meds_silver.filter(F.col('data_quality_issue').isNull()).count()}")
+print(f"  Total Records: {meds_report['total']}")
+print(f"  Standardized Medication Names: {meds_report['standardized']}")
+print(f"  Valid Records: {meds_report['valid']}")
 
 print("\n" + "="*70)
 
@@ -704,14 +793,15 @@ print("\n" + "="*70)
 # COMMAND ----------
 
 # Create a metrics DataFrame for future reference
+# Reuse the counts collected for the quality report
 metrics_data = [
-    ("patients_total", df_patients_silver.count()),
-    ("patients_unique", df_patients_silver.select('patient_key').distinct().count()),
-    ("patients_duplicates", df_patients_silver.filter(F.col('is_duplicate') == 1).count()),
-    ("diagnoses_total", df_diagnoses_silver.count()),
-    ("labs_total", df_labs_silver.count()),
-    ("labs_outliers", df_labs_silver.filter(F.col('is_outlier') == 1).count()),
-    ("medications_total", df_meds_silver.count()),
+    ("patients_total", patients_report['total']),
+    ("patients_unique", patients_report['total'] - patients_report['dups']),
+    ("patients_duplicates", patients_report['dups']),
+    ("diagnoses_total", diagnoses_report['total']),
+    ("labs_total", labs_report['total']),
+    ("labs_outliers", labs_report['outliers']),
+    ("medications_total", meds_report['total']),
 ]
 
 df_metrics = spark.createDataFrame(metrics_data, ["metric", "value"]).withColumn(
@@ -734,17 +824,22 @@ print("✓ Quality metrics saved to Gold layer")
 # Read the final Gold layer table
 df_gold_final = spark.read.format("delta").load(f"{gold_path}patient_readmission_features")
 
+gold_final_stats = df_gold_final.agg(
+    F.count("*").alias("total"),
+    F.sum("target_readmitted_30_days").alias("readmitted")
+).first()
+
 print("\n" + "="*70)
 print("GOLD LAYER - FINAL FEATURES TABLE")
 print("="*70)
-print(f"\nShape: {df_gold_final.count()} patients × {len(df_gold_final.columns)} features")
+print(f"\nShape: {gold_final_stats['total']} patients × {len(df_gold_final.columns)} features")
 print(f"\nColumns:")
 for col in df_gold_final.columns:
     print(f"  - {col}")
 
 print(f"\nTarget Variable Distribution:")
-print(f"  - Readmitted (1): {df_gold_final.filter(F.col('target_readmitted_30_days') == 1).count()}")
-print(f"  - Not Readmitted (0): {df_gold_final.filter(F.col('target_readmitted_30_days') == 0).count()}")
+print(f"  - Readmitted (1): {gold_final_stats['readmitted']}")
+print(f"  - Not Readmitted (0): {gold_final_stats['total'] - gold_final_stats['readmitted']}")
 
 print(f"\nFeature Statistics:")
 df_gold_final.describe().show()
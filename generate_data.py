@@ -12,7 +12,7 @@ This script creates realistic, HIPAA-safe synthetic patient data that includes:
 Usage:
     python generate_healthcare_data.py
 
-Output Files:
+Output Files (each also written as .parquet for the Bronze ingest):
     - patients.csv (1000 records with 10% intentional duplicates)
     - diagnoses.csv (3000+ diagnosis records)
     - lab_results.csv (5000+ lab result records)
@@ -21,15 +21,55 @@ Output Files:
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+
+# Set seed for reproducibility (one PCG64 generator drives every draw)
+rng = np.random.default_rng(42)
+
+
+def save_table(df, name):
+    """Write df as <name>.csv and <name>.parquet from a single Arrow conversion."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Arrow's columnar CSV writer formats whole batches in C++ into memory; the files are
+    # small enough to land on disk with one write call
+    buffer = pa.BufferOutputStream()
+    pacsv.write_csv(table, buffer, write_options=pacsv.WriteOptions(batch_size=8192))
+    with open(f'{name}.csv', 'wb') as f:
+        f.write(buffer.getvalue())
+    # Integers as int32 to match the Bronze IntegerType schema
+    schema = pa.schema([
+        pa.field(field.name, pa.int32()) if pa.types.is_integer(field.type) else field
+        for field in table.schema
+    ])
+    # zstd + dictionary encoding keeps the low-cardinality code/name columns small
+    pq.write_table(
+        table.cast(schema), f'{name}.parquet',
+        compression='zstd', compression_level=3, use_dictionary=True, row_group_size=65536
+    )
+
+
+def variation_matrix(variations):
+    """Pad each entry's spelling variations into a 2D object array, plus the real counts per row."""
+    width = max(len(v) for v in variations.values())
+    matrix = np.array([v + [v[0]] * (width - len(v)) for v in variations.values()], dtype=object)
+    return matrix, np.array([len(v) for v in variations.values()])
+
+
+def submit_table(df, name):
+    """Queue df for writing on the background executor and remember it for the final report."""
+    outputs.append((df, name, executor.submit(save_table, df, name)))
 
-# Set seed for reproducibility
-np.random.seed(42)
-random.seed(42)
 
 print("Generating synthetic healthcare dataset...\n")
 
+# Each table is handed to a writer thread as soon as it is built, so file output
+# overlaps with generating the next table instead of waiting for all four
+executor = ThreadPoolExecutor(max_workers=4)
+outputs = []
+
 # ============================================================================
 # 1. GENERATE PATIENTS TABLE (WITH INTENTIONAL DUPLICATES)
 # ============================================================================
@@ -45,47 +85,52 @@ last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia',
               'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez',
               'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson']
 
-patients_data = []
-
-for i in range(1, n_patients + 1):
-    dob = datetime(1930, 1, 1) + timedelta(days=random.randint(0, 365*80))
-    admission_date = datetime(2023, 1, 1) + timedelta(days=random.randint(0, 365))
-    length_of_stay = random.randint(1, 30)
-    discharge_date = admission_date + timedelta(days=length_of_stay)
-    
-    # 20% readmission rate (realistic)
-    readmitted = 1 if random.random() < 0.20 else 0
-    
-    patients_data.append({
-        'patient_id': i,
-        'first_name': random.choice(first_names),
-        'last_name': random.choice(last_names),
-        'date_of_birth': dob.strftime('%m/%d/%Y'),  # Intentional format inconsistency
-        'age': (admission_date.year - dob.year),
-        'gender': random.choice(['M', 'F', 'U']),
-        'admission_date': admission_date.strftime('%Y-%m-%d'),
-        'discharge_date': discharge_date.strftime('%Y-%m-%d'),
-        'length_of_stay': length_of_stay,
-        'readmitted_30_days': readmitted
-    })
+# Draw each column in a single vectorized call instead of looping per patient
+# Dates stay as datetime64[D] arrays and are formatted once per column
+dob = np.datetime64('1930-01-01') + rng.integers(0, 365*80 + 1, n_patients).astype('timedelta64[D]')
+admission_date = np.datetime64('2023-01-01') + rng.integers(0, 365 + 1, n_patients).astype('timedelta64[D]')
+length_of_stay = rng.integers(1, 31, n_patients)
+discharge_date = admission_date + length_of_stay.astype('timedelta64[D]')
+# Age in calendar years as a plain integer subtraction on datetime64[Y]
+age = admission_date.astype('datetime64[Y]').astype(int) - dob.astype('datetime64[Y]').astype(int)
+
+# 20% readmission rate (realistic)
+readmitted = (rng.random(n_patients) < 0.20).astype(np.int8)
+
+df_patients = pd.DataFrame({
+    'patient_id': np.arange(1, n_patients + 1, dtype=np.int32),
+    'first_name': rng.choice(first_names, n_patients),
+    'last_name': rng.choice(last_names, n_patients),
+    'date_of_birth': pd.Series(dob).dt.strftime('%m/%d/%Y'),  # Intentional format inconsistency
+    'age': age,
+    'gender': pd.Categorical(rng.choice(['M', 'F', 'U'], n_patients), categories=['M', 'F', 'U']),
+    'admission_date': np.datetime_as_string(admission_date, unit='D'),
+    'discharge_date': np.datetime_as_string(discharge_date, unit='D'),
+    'length_of_stay': length_of_stay,
+    'readmitted_30_days': readmitted
+})
 
 # Add intentional duplicates (10% of dataset) - shows deduplication need
 print(f"   - Created {n_patients} unique patient records")
 print(f"   - Adding intentional duplicates to demonstrate deduplication skills...")
 
 duplicate_count = 100
-for _ in range(duplicate_count):
-    original = random.choice(patients_data[:-100])  # Don't duplicate duplicates
-    duplicate = original.copy()
-    duplicate['patient_id'] = n_patients + _ + 1
-    # Intentionally introduce small variations to test fuzzy matching
-    if random.random() < 0.5:
-        duplicate['first_name'] = original['first_name'][:-1]  # Typo
-    patients_data.append(duplicate)
-
-df_patients = pd.DataFrame(patients_data)
-df_patients.to_csv('patients.csv', index=False)
-print(f"   ✓ Saved: patients.csv ({len(df_patients)} total records)")
+duplicate_sources = rng.integers(0, n_patients, duplicate_count)  # Don't duplicate duplicates
+df_duplicates = df_patients.iloc[duplicate_sources].reset_index(drop=True)
+df_duplicates['patient_id'] = np.arange(n_patients + 1, n_patients + duplicate_count + 1, dtype=np.int32)
+# Intentionally introduce small variations to test fuzzy matching
+typo = rng.random(duplicate_count) < 0.5
+df_duplicates.loc[typo, 'first_name'] = df_duplicates.loc[typo, 'first_name'].str[:-1]  # Typo
+
+df_patients = pd.concat([df_patients, df_duplicates], ignore_index=True)
+
+# Source row of every patient record (duplicates point back at their original), so labs/meds
+# and the summary index the generator arrays instead of re-parsing or re-scanning the DataFrame
+stay_rows = np.concatenate([np.arange(n_patients), duplicate_sources])
+admission_dates = admission_date[stay_rows]
+discharge_dates = discharge_date[stay_rows]
+print(f"   ✓ Generated: {len(df_patients)} total records")
+submit_table(df_patients, 'patients')
 
 # ============================================================================
 # 2. GENERATE DIAGNOSES TABLE (WITH INCONSISTENT ICD-10 FORMATTING)
@@ -115,30 +160,34 @@ diagnoses_descriptions = {
     'M79.3': 'Myalgia',
 }
 
-diagnoses_data = []
-diagnosis_id = 1
-
-for _, patient in df_patients.iterrows():
-    # Each patient has 2-4 diagnoses
-    num_diagnoses = random.randint(2, 4)
-    selected_codes = random.sample(list(diagnosis_codes.keys()), num_diagnoses)
-    
-    for idx, code in enumerate(selected_codes):
-        # Use variations to show data quality issues
-        selected_variation = random.choice(diagnosis_codes[code])
-        
-        diagnoses_data.append({
-            'diagnosis_id': diagnosis_id,
-            'patient_id': patient['patient_id'],
-            'diagnosis_code': selected_variation,  # Inconsistent formatting
-            'diagnosis_description': diagnoses_descriptions[code],
-            'primary_diagnosis': 1 if idx == 0 else 0
-        })
-        diagnosis_id += 1
-
-df_diagnoses = pd.DataFrame(diagnoses_data)
-df_diagnoses.to_csv('diagnoses.csv', index=False)
-print(f"   ✓ Saved: diagnoses.csv ({len(df_diagnoses)} records)")
+# Each patient has 2-4 distinct diagnoses, drawn for all patients at once
+patient_ids = df_patients['patient_id'].to_numpy(np.int32)
+num_diagnoses = rng.integers(2, 5, len(patient_ids))
+total_diagnoses = num_diagnoses.sum()
+
+code_keys = np.array(list(diagnosis_codes.keys()))
+# Sample without replacement: shuffle code indices per patient, keep the first num_diagnoses
+code_order = rng.permuted(np.tile(np.arange(len(code_keys)), (len(patient_ids), 1)), axis=1)
+code_idx = code_order[np.arange(len(code_keys)) < num_diagnoses[:, None]]
+
+# Use variations to show data quality issues (padded to a matrix for fancy indexing)
+variations, variation_counts = variation_matrix(diagnosis_codes)
+variation_idx = rng.integers(0, variation_counts[code_idx])
+
+descriptions = np.array([diagnoses_descriptions[code] for code in code_keys], dtype=object)
+# First diagnosis of each patient is the primary one: scatter 1s at each patient's first row
+primary_diagnosis = np.zeros(total_diagnoses, dtype=np.int8)
+primary_diagnosis[num_diagnoses.cumsum() - num_diagnoses] = 1
+
+df_diagnoses = pd.DataFrame({
+    'diagnosis_id': np.arange(1, total_diagnoses + 1, dtype=np.int32),
+    'patient_id': np.repeat(patient_ids, num_diagnoses),
+    'diagnosis_code': pd.Categorical(variations[code_idx, variation_idx]),  # Inconsistent formatting
+    'diagnosis_description': pd.Categorical.from_codes(code_idx, categories=descriptions),  # Codes index the known vocabulary
+    'primary_diagnosis': primary_diagnosis
+})
+print(f"   ✓ Generated: {len(df_diagnoses)} records")
+submit_table(df_diagnoses, 'diagnoses')
 
 # ============================================================================
 # 3. GENERATE LAB RESULTS TABLE (WITH OUTLIERS)
@@ -153,41 +202,37 @@ lab_tests = {
     'BUN': {'normal_range': '7-20 mg/dL', 'mean': 15, 'std': 5},
 }
 
-lab_data = []
-lab_id = 1
-
-for _, patient in df_patients.iterrows():
-    # Each patient has 4-8 lab tests during stay
-    num_tests = random.randint(4, 8)
-    selected_tests = random.choices(list(lab_tests.keys()), k=num_tests)
-    
-    admission = datetime.strptime(patient['admission_date'], '%Y-%m-%d')
-    discharge = datetime.strptime(patient['discharge_date'], '%Y-%m-%d')
-    
-    for test in selected_tests:
-        test_info = lab_tests[test]
-        
-        # Generate realistic values with occasional outliers
-        if random.random() < 0.05:  # 5% outliers
-            value = test_info['mean'] * random.uniform(0.5, 2.0)
-        else:
-            value = np.random.normal(test_info['mean'], test_info['std'])
-        
-        test_date = admission + timedelta(days=random.randint(0, (discharge - admission).days))
-        
-        lab_data.append({
-            'lab_id': lab_id,
-            'patient_id': patient['patient_id'],
-            'test_name': test,
-            'test_value': round(max(0.1, value), 2),  # No negative values
-            'test_date': test_date.strftime('%Y-%m-%d'),
-            'reference_range': test_info['normal_range']
-        })
-        lab_id += 1
-
-df_labs = pd.DataFrame(lab_data)
-df_labs.to_csv('lab_results.csv', index=False)
-print(f"   ✓ Saved: lab_results.csv ({len(df_labs)} records)")
+# Each patient has 4-8 lab tests during stay
+num_tests = rng.integers(4, 9, len(patient_ids))
+total_labs = num_tests.sum()
+
+test_names = np.array(list(lab_tests.keys()))
+test_idx = rng.integers(0, len(test_names), total_labs)
+means = np.array([t['mean'] for t in lab_tests.values()])[test_idx]
+stds = np.array([t['std'] for t in lab_tests.values()])[test_idx]
+reference_ranges = np.array([t['normal_range'] for t in lab_tests.values()], dtype=object)
+
+# Generate realistic values with occasional outliers (5%), one draw for all rows
+test_values = rng.normal(means, stds)
+outliers = rng.random(total_labs) < 0.05
+test_values[outliers] = means[outliers] * rng.uniform(0.5, 2.0, outliers.sum())
+test_values = np.round(np.maximum(0.1, test_values), 2)  # No negative values
+
+# Test dates fall anywhere within the stay
+stay_days = (discharge_dates - admission_dates).astype(int)
+test_offsets = (rng.random(total_labs) * np.repeat(stay_days + 1, num_tests)).astype(int)
+test_dates = np.repeat(admission_dates, num_tests) + test_offsets.astype('timedelta64[D]')
+
+df_labs = pd.DataFrame({
+    'lab_id': np.arange(1, total_labs + 1, dtype=np.int32),
+    'patient_id': np.repeat(patient_ids, num_tests),
+    'test_name': pd.Categorical.from_codes(test_idx, categories=test_names),
+    'test_value': test_values,
+    'test_date': np.datetime_as_string(test_dates, unit='D'),
+    'reference_range': pd.Categorical.from_codes(test_idx, categories=reference_ranges)
+})
+print(f"   ✓ Generated: {len(df_labs)} records")
+submit_table(df_labs, 'lab_results')
 
 # ============================================================================
 # 4. GENERATE MEDICATIONS TABLE (WITH SPELLING INCONSISTENCIES)
@@ -206,41 +251,44 @@ medication_variations = {
 frequencies = ['Once daily', 'Twice daily', 'Three times daily', 'As needed', 'Every 8 hours']
 dosages = ['500 mg', '1000 mg', '10 mg', '20 mg', '50 mg', '100 mg', '2 tabs', '1 tab']
 
-medications_data = []
-med_id = 1
-
-for _, patient in df_patients.iterrows():
-    # Each patient takes 3-6 medications
-    num_meds = random.randint(3, 6)
-    selected_meds = random.choices(list(medication_variations.keys()), k=num_meds)
-    
-    admission = datetime.strptime(patient['admission_date'], '%Y-%m-%d')
-    discharge = datetime.strptime(patient['discharge_date'], '%Y-%m-%d')
-    
-    for med in selected_meds:
-        # Use variations to show standardization need
-        med_name = random.choice(medication_variations[med])
-        
-        start_date = admission - timedelta(days=random.randint(0, 30))
-        end_date = discharge + timedelta(days=random.randint(0, 90))
-        
-        medications_data.append({
-            'medication_id': med_id,
-            'patient_id': patient['patient_id'],
-            'medication_name': med_name,  # Inconsistent spelling
-            'dosage': random.choice(dosages),
-            'frequency': random.choice(frequencies),
-            'start_date': start_date.strftime('%Y-%m-%d'),
-            'end_date': end_date.strftime('%Y-%m-%d')
-        })
-        med_id += 1
-
-df_medications = pd.DataFrame(medications_data)
-df_medications.to_csv('medications.csv', index=False)
-print(f"   ✓ Saved: medications.csv ({len(df_medications)} records)")
+# Each patient takes 3-6 medications
+num_meds = rng.integers(3, 7, len(patient_ids))
+total_meds = num_meds.sum()
+
+med_idx = rng.integers(0, len(medication_variations), total_meds)
+# Use variations to show standardization need
+med_variations, med_variation_counts = variation_matrix(medication_variations)
+med_variation_idx = rng.integers(0, med_variation_counts[med_idx])
+
+start_dates = np.repeat(admission_dates, num_meds) - rng.integers(0, 31, total_meds).astype('timedelta64[D]')
+end_dates = np.repeat(discharge_dates, num_meds) + rng.integers(0, 91, total_meds).astype('timedelta64[D]')
+
+df_medications = pd.DataFrame({
+    'medication_id': np.arange(1, total_meds + 1, dtype=np.int32),
+    'patient_id': np.repeat(patient_ids, num_meds),
+    'medication_name': pd.Categorical(med_variations[med_idx, med_variation_idx]),  # Inconsistent spelling
+    'dosage': pd.Categorical.from_codes(rng.integers(0, len(dosages), total_meds), categories=dosages),
+    'frequency': pd.Categorical.from_codes(rng.integers(0, len(frequencies), total_meds), categories=frequencies),
+    'start_date': np.datetime_as_string(start_dates, unit='D'),
+    'end_date': np.datetime_as_string(end_dates, unit='D')
+})
+print(f"   ✓ Generated: {len(df_medications)} records")
+submit_table(df_medications, 'medications')
+
+# ============================================================================
+# 5. WRITE OUTPUT FILES
+# ============================================================================
+print("\n5. Writing output files...")
+
+# Wait for the background writes (Arrow's writers release the GIL); result() re-raises any write error
+for df, name, write in outputs:
+    write.result()
+    print(f"   ✓ Saved: {name}.csv, {name}.parquet ({len(df)} records)")
+
+executor.shutdown()
 
 # ============================================================================
-# 5. SUMMARY STATISTICS
+# 6. SUMMARY STATISTICS
 # ============================================================================
 print("\n" + "="*70)
 print("DATASET SUMMARY")
@@ -249,8 +297,8 @@ print("="*70)
 print(f"\n📊 Patients: {len(df_patients)} records")
 print(f"   - Unique patients: {len(df_patients) - duplicate_count}")
 print(f"   - Intentional duplicates: {duplicate_count} (to show deduplication)")
-print(f"   - Readmission rate: {df_patients['readmitted_30_days'].mean()*100:.1f}%")
-print(f"   - Avg length of stay: {df_patients['length_of_stay'].mean():.1f} days")
+print(f"   - Readmission rate: {readmitted[stay_rows].mean()*100:.1f}%")
+print(f"   - Avg length of stay: {length_of_stay[stay_rows].mean():.1f} days")
 
 print(f"\n📋 Diagnoses: {len(df_diagnoses)} records")
 print(f"   - Avg diagnoses per patient: {len(df_diagnoses)/len(df_patients):.1f}")
@@ -265,6 +313,6 @@ print("\n✅ All data files created successfully!")
 print("   Ready to upload to Databricks and start the pipeline.\n")
 
 print("Next steps:")
-print("1. Upload CSV files to Databricks workspace")
+print("1. Upload the Parquet files to Databricks workspace")
 print("2. Create a new notebook for the ETL pipeline")
 print("3. Implement Bronze → Silver → Gold transformations")